@@ -4,241 +4,324 @@ Comprehensive link audit for betadocs.
 Checks all markdown links, verifies targets exist, and identifies issues.
 """
 
+import bisect
+import functools
 import os
+import posixpath
 import re
-from pathlib import Path
-from collections import defaultdict
-from typing import Dict, List, Tuple, Optional
+import sys
+from collections import Counter, defaultdict
+from typing import Dict, Iterator, List, NamedTuple, Set, Tuple, Optional
 
 # Configuration
-BETADOCS_ROOT = Path("docs/betadocs")
-LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
-
-# Track results
-results = {
-    'total_files': 0,
-    'total_links': 0,
-    'valid_links': 0,
-    'broken_links': [],
-    'external_links': [],
-    'anchor_links': [],
-    'redundant_links': defaultdict(list),
-    'path_issues': [],
-    'file_details': {}
-}
-
-# Build file map
+BETADOCS_ROOT = "docs/betadocs"
+# Skips image syntax (![alt](src)) and nested brackets. The URL is either
+# <bracketed> (group 2, single line, per CommonMark) or bare (group 3), and may
+# be followed by an optional single-line "title", 'title' or (title); an
+# unterminated < or title fails the match rather than running on into later
+# links. The image check sits after the leading '[' so the pattern starts with
+# a literal, letting re jump between candidates with its fast prefix search
+# instead of trying every offset.
+LINK_PATTERN = re.compile(
+    rb'\[(?<!!\[)([^\[\]]+)\]'
+    rb'\(\s*(?:<([^<>\n]+)>|([^\s)]+))'
+    rb'(?:\s+(?:"[^"\n]*"|\'[^\'\n]*\'|\([^()\n]*\)))?\s*\)'
+)
+LINE_BREAK_PATTERN = re.compile(rb'\r\n?|\n')
+# Below this many files a process pool costs more than it saves
+PARALLEL_MIN_FILES = 500
+SCAN_CHUNKSIZE = 16
+# Classifies a link URL by its prefix in a single match; anything else is relative
+URL_CLASSIFIER = re.compile(
+    r'(?P<external>https?://|mailto:)'
+    r'|(?P<anchor>#)'
+    r'|(?P<docs_absolute>/docs/)'
+    r'|(?P<absolute>/)'
+)
+
+class LinkInfo(NamedTuple):
+    source: str
+    text: str
+    url: str
+    resolved: Optional[str]
+    type: str
+    line: int
+    status: str = ''
+
+# File map, built once in the parent and handed to each worker
 file_map = {}
-for md_file in BETADOCS_ROOT.rglob("*.md"):
-    rel_path = str(md_file.relative_to(BETADOCS_ROOT)).replace('.md', '').strip()
-    if rel_path.endswith(' '):
-        rel_path = rel_path[:-1]
-    # Multiple path formats for lookup
-    file_map[rel_path] = md_file
-    file_map[f"/docs/{rel_path}"] = md_file
-    file_map[f"docs/{rel_path}"] = md_file
-    # Also map without leading slash
-    if rel_path.startswith('/'):
-        file_map[rel_path[1:]] = md_file
-
-def resolve_link_path(link_url: str, source_file: Path) -> Tuple[Optional[str], str]:
-    """Resolve a link URL to a file path. Returns (resolved_path, link_type)."""
-    # Remove anchor
-    url = link_url.split('#')[0]
+# Directories that have a README, so a directory link resolves to it
+readme_dirs = set()
+
+def walk_md(root: str) -> Iterator[str]:
+    """Yield the path of every .md file under root, one scandir per directory."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.md'):
+                    yield entry.path
+
+def build_file_map(md_files: List[str]) -> Dict[str, str]:
+    """Map each betadocs file's canonical path (relative, no .md) to its path."""
+    file_map = {}
+    for md_file in md_files:
+        rel_path = os.path.relpath(md_file, BETADOCS_ROOT).removesuffix('.md').strip()
+        if rel_path.endswith(' '):
+            rel_path = rel_path[:-1]
+        file_map[rel_path] = md_file
+    return file_map
+
+def _init_worker(shared_file_map: Dict[str, str], shared_readme_dirs: Set[str]) -> None:
+    global file_map, readme_dirs
+    file_map = shared_file_map
+    readme_dirs = shared_readme_dirs
+    check_file_exists.cache_clear()
+
+@functools.lru_cache(maxsize=65536)
+def resolve_link_path(link_url: str, source_dir: str) -> Tuple[Optional[str], str]:
+    """Resolve a link URL to a file path. Returns (resolved_path, link_type).
+
+    source_dir is the linking file's directory relative to BETADOCS_ROOT
+    ('' for the root), so results can be cached per (url, directory).
+    """
+    match = URL_CLASSIFIER.match(link_url)
+    kind = match.lastgroup if match else None
     
     # External links
-    if url.startswith(('http://', 'https://', 'mailto:')):
+    if kind == 'external':
         return None, 'external'
     
     # Anchor-only links
-    if url.startswith('#'):
+    if kind == 'anchor':
         return None, 'anchor'
     
-    # Remove .md extension if present
-    url = url.replace('.md', '').replace('.MD', '')
+    # Remove anchor and .md extension if present
+    url = link_url.split('#')[0].removesuffix('.md').removesuffix('.MD')
     
     # Absolute paths starting with /docs/
-    if url.startswith('/docs/'):
-        path_without_docs = url[6:]  # Remove '/docs/'
-        return path_without_docs, 'absolute'
-    
-    # Relative paths
-    if url.startswith('../') or url.startswith('./') or not url.startswith('/'):
-        source_dir = str(source_file.parent.relative_to(BETADOCS_ROOT))
-        if source_dir == '.':
-            source_dir = ''
-        
-        # Handle relative path resolution
-        if url.startswith('./'):
-            url = url[2:]
-        elif url.startswith('../'):
-            # Go up directories
-            parts = source_dir.split('/') if source_dir else []
-            rel_parts = url.split('/')
-            
-            for part in rel_parts:
-                if part == '..':
-                    if parts:
-                        parts.pop()
-                elif part == '.' or part == '':
-                    continue
-                else:
-                    parts.append(part)
-            
-            resolved = '/'.join(parts) if parts else ''
-            return resolved, 'relative'
-        else:
-            # Relative to current directory
-            if source_dir:
-                resolved = f"{source_dir}/{url}"
-            else:
-                resolved = url
-            return resolved, 'relative'
+    if kind == 'docs_absolute':
+        return url[6:], 'absolute'  # Remove '/docs/'
     
     # Absolute path without /docs/
-    if url.startswith('/'):
+    if kind == 'absolute':
         return url[1:], 'absolute'
     
-    return url, 'relative'
+    # Relative paths (../, ./ or bare), resolved against the source directory
+    resolved = posixpath.normpath(posixpath.join(source_dir, url))
+    if resolved == '.':
+        resolved = ''
+    return resolved, 'relative'
 
+@functools.lru_cache(maxsize=None)
 def check_file_exists(resolved_path: str) -> bool:
-    """Check if a resolved path exists in the file map."""
+    """Check if a resolved path exists in the file map.
+
+    Cached: file_map and readme_dirs are fixed once _init_worker installs them.
+    """
     if not resolved_path:
         return False
     
-    # Try multiple path formats
-    for path_variant in [resolved_path, f"/docs/{resolved_path}", f"docs/{resolved_path}"]:
-        if path_variant in file_map:
-            return True
-    
-    # Check if it's a directory (README.md)
-    if resolved_path.endswith('/README'):
-        resolved_path = resolved_path[:-7]
-    elif not resolved_path.endswith('/README'):
-        # Try with README
-        readme_path = f"{resolved_path}/README"
-        if readme_path in file_map:
-            return True
-    
-    return False
+    # resolve_link_path already strips /docs/ and / from absolute links, so
+    # resolved paths are in canonical form
+    return resolved_path in file_map or resolved_path in readme_dirs
 
-# Process each file
-for md_file in sorted(BETADOCS_ROOT.rglob("*.md")):
-    results['total_files'] += 1
-    rel_path = str(md_file.relative_to(BETADOCS_ROOT))
+def scan_file(md_file: str) -> Dict:
+    """Scan one markdown file. Returns partial results for the driver to merge."""
+    rel_path = os.path.relpath(md_file, BETADOCS_ROOT)
+    source_dir = os.path.dirname(rel_path)
+    partial = {
+        'rel_path': rel_path,
+        'total_links': 0,
+        'valid_links': 0,
+        'broken_links': [],
+        'external_links': [],
+        'anchor_links': [],
+        'redundant_counts': Counter(),
+    }
     
     try:
-        content = md_file.read_text(encoding='utf-8')
-        file_links = []
+        # Scan raw bytes; only matched link groups are decoded
+        with open(md_file, 'rb') as f:
+            content = f.read()
+        file_links = []  # Broken links only
+        total_links = 0
+        file_valid = 0
+        redundant_counts = partial['redundant_counts']
+        # Line-break offsets for line-number lookup; \r\n, \r and \n each end
+        # a line, as with universal newlines
+        newline_offsets = [m.start() for m in LINE_BREAK_PATTERN.finditer(content)]
         
         for match in LINK_PATTERN.finditer(content):
-            results['total_links'] += 1
-            link_text = match.group(1)
-            link_url = match.group(2)
+            total_links += 1
+            link_url = (match.group(2) or match.group(3)).decode('utf-8', 'replace')
             
-            resolved_path, link_type = resolve_link_path(link_url, md_file)
+            resolved_path, link_type = resolve_link_path(link_url, source_dir)
             
-            link_info = {
-                'source': rel_path,
-                'text': link_text,
-                'url': link_url,
-                'resolved': resolved_path,
-                'type': link_type,
-                'line': content[:match.start()].count('\n') + 1
-            }
+            # Valid links are only counted: no text decode, line lookup or record
+            if resolved_path and check_file_exists(resolved_path):
+                file_valid += 1
+                # Check for redundancy (same target from multiple sources)
+                redundant_counts[resolved_path] += 1
+                continue
+            
+            link_text = match.group(1).decode('utf-8', 'replace')
+            line = bisect.bisect_right(newline_offsets, match.start()) + 1
             
             if link_type == 'external':
-                results['external_links'].append(link_info)
+                partial['external_links'].append(
+                    LinkInfo(rel_path, link_text, link_url, resolved_path, link_type, line))
                 continue
             
             if link_type == 'anchor':
-                results['anchor_links'].append(link_info)
+                partial['anchor_links'].append(
+                    LinkInfo(rel_path, link_text, link_url, resolved_path, link_type, line))
                 continue
             
-            # Check if file exists
-            if resolved_path and check_file_exists(resolved_path):
-                results['valid_links'] += 1
-                link_info['status'] = 'ok'
-                file_links.append(link_info)
-                
-                # Check for redundancy (same target from multiple sources)
-                target_key = resolved_path
-                results['redundant_links'][target_key].append(link_info)
-            else:
-                link_info['status'] = 'broken'
-                results['broken_links'].append(link_info)
-                file_links.append(link_info)
+            link_info = LinkInfo(rel_path, link_text, link_url, resolved_path, link_type, line, 'broken')
+            partial['broken_links'].append(link_info)
+            file_links.append(link_info)
         
-        results['file_details'][rel_path] = {
-            'total_links': len(file_links),
-            'valid_links': len([l for l in file_links if l.get('status') == 'ok']),
-            'broken_links': len([l for l in file_links if l.get('status') == 'broken']),
+        partial['total_links'] = total_links
+        partial['valid_links'] = file_valid
+        partial['file_details'] = {
+            'total_links': file_valid + len(file_links),
+            'valid_links': file_valid,
+            'broken_links': len(file_links),
             'links': file_links
         }
         
     except Exception as e:
-        results['file_details'][rel_path] = {
+        partial['file_details'] = {
             'error': str(e),
             'links': []
         }
+    
+    return partial
 
-# Generate report
-print("=" * 80)
-print("BETADOCS LINK AUDIT REPORT")
-print("=" * 80)
-print(f"\nTotal files processed: {results['total_files']}")
-print(f"Total links found: {results['total_links']}")
-print(f"Valid links: {results['valid_links']}")
-print(f"Broken links: {len(results['broken_links'])}")
-print(f"External links: {len(results['external_links'])}")
-print(f"Anchor links: {len(results['anchor_links'])}")
-
-# Broken links by file
-if results['broken_links']:
-    print("\n" + "=" * 80)
-    print("BROKEN LINKS")
-    print("=" * 80)
+def scan_files(md_files: List[str], shared_file_map: Dict[str, str],
+               shared_readme_dirs: Set[str]) -> Iterator[Dict]:
+    """Yield scan_file results in md_files order; large trees use a process pool."""
+    if len(md_files) < PARALLEL_MIN_FILES:
+        # Serial: relies on the maps main() installed in this process
+        yield from map(scan_file, md_files)
+        return
     
-    broken_by_file = defaultdict(list)
-    for link in results['broken_links']:
-        broken_by_file[link['source']].append(link)
+    # Imported lazily; concurrent.futures alone adds ~20ms to startup
+    from concurrent.futures import ProcessPoolExecutor
+    chunks = -(-len(md_files) // SCAN_CHUNKSIZE)
+    max_workers = min(os.cpu_count() or 1, chunks)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(shared_file_map, shared_readme_dirs)) as executor:
+        yield from executor.map(scan_file, md_files, chunksize=SCAN_CHUNKSIZE)
+
+def main() -> None:
+    if not os.path.isdir(BETADOCS_ROOT):
+        sys.exit(f"Error: {BETADOCS_ROOT} not found; run this script from the repo root.")
+    
+    # Enumerate once, sorted by path string so the report can use the
+    # traversal order without re-sorting
+    md_files = sorted(walk_md(BETADOCS_ROOT))
     
-    for file_path in sorted(broken_by_file.keys()):
-        print(f"\n{file_path}:")
-        for link in broken_by_file[file_path]:
-            print(f"  Line {link['line']}: [{link['text']}]({link['url']})")
-            print(f"    -> Resolved to: {link['resolved']}")
-            print(f"    -> Type: {link['type']}")
-
-# Redundant links (same target linked from many places)
-print("\n" + "=" * 80)
-print("REDUNDANT LINKS (targets linked from 5+ sources)")
-print("=" * 80)
-for target, links in sorted(results['redundant_links'].items()):
-    if len(links) >= 5:
-        print(f"\n{target} ({len(links)} links):")
-        sources = set(l['source'] for l in links)
+    # Build file map and install it here too, so in-process checks see it
+    shared_file_map = build_file_map(md_files)
+    shared_readme_dirs = {p[:-7] for p in shared_file_map if p.endswith('/README')}
+    _init_worker(shared_file_map, shared_readme_dirs)
+
+    # Track results
+    results = {
+        'total_files': 0,
+        'total_links': 0,
+        'valid_links': 0,
+        'broken_links': [],
+        'external_links': [],
+        'anchor_links': [],
+        'redundant_counts': Counter(),
+        'redundant_sources': defaultdict(set),
+        'path_issues': [],
+        'file_details': {}
+    }
+
+    for partial in scan_files(md_files, shared_file_map, shared_readme_dirs):
+        results['total_files'] += 1
+        results['total_links'] += partial['total_links']
+        results['valid_links'] += partial['valid_links']
+        results['broken_links'].extend(partial['broken_links'])
+        results['external_links'].extend(partial['external_links'])
+        results['anchor_links'].extend(partial['anchor_links'])
+        results['redundant_counts'].update(partial['redundant_counts'])
+        for target in partial['redundant_counts']:
+            results['redundant_sources'][target].add(partial['rel_path'])
+        results['file_details'][partial['rel_path']] = partial['file_details']
+
+    # Generate report (buffered and written once)
+    lines = []
+    lines.append("=" * 80)
+    lines.append("BETADOCS LINK AUDIT REPORT")
+    lines.append("=" * 80)
+    lines.append(f"\nTotal files processed: {results['total_files']}")
+    lines.append(f"Total links found: {results['total_links']}")
+    lines.append(f"Valid links: {results['valid_links']}")
+    lines.append(f"Broken links: {len(results['broken_links'])}")
+    lines.append(f"External links: {len(results['external_links'])}")
+    lines.append(f"Anchor links: {len(results['anchor_links'])}")
+
+    # Broken links by file
+    if results['broken_links']:
+        lines.append("\n" + "=" * 80)
+        lines.append("BROKEN LINKS")
+        lines.append("=" * 80)
+    
+        broken_by_file = defaultdict(list)
+        for link in results['broken_links']:
+            broken_by_file[link.source].append(link)
+    
+        # Already in file traversal order (see md_files)
+        for file_path in broken_by_file:
+            lines.append(f"\n{file_path}:")
+            for link in broken_by_file[file_path]:
+                lines.append(f"  Line {link.line}: [{link.text}]({link.url})")
+                lines.append(f"    -> Resolved to: {link.resolved}")
+                lines.append(f"    -> Type: {link.type}")
+
+    # Redundant links (same target linked from many places)
+    lines.append("\n" + "=" * 80)
+    lines.append("REDUNDANT LINKS (targets linked from 5+ sources)")
+    lines.append("=" * 80)
+    # Only sort the targets that make the cut
+    redundant_targets = sorted(
+        target for target, count in results['redundant_counts'].items() if count >= 5
+    )
+    for target in redundant_targets:
+        lines.append(f"\n{target} ({results['redundant_counts'][target]} links):")
+        sources = results['redundant_sources'][target]
         for source in sorted(sources)[:10]:  # Show first 10
-            print(f"  - {source}")
+            lines.append(f"  - {source}")
         if len(sources) > 10:
-            print(f"  ... and {len(sources) - 10} more")
-
-# Files with most links
-print("\n" + "=" * 80)
-print("FILES WITH MOST LINKS")
-print("=" * 80)
-files_by_links = sorted(
-    [(path, info['total_links']) for path, info in results['file_details'].items() if 'total_links' in info],
-    key=lambda x: x[1],
-    reverse=True
-)
-for path, count in files_by_links[:15]:
-    info = results['file_details'][path]
-    valid = info.get('valid_links', 0)
-    broken = info.get('broken_links', 0)
-    print(f"{path}: {count} links ({valid} valid, {broken} broken)")
+            lines.append(f"  ... and {len(sources) - 10} more")
+
+    # Files with most links
+    lines.append("\n" + "=" * 80)
+    lines.append("FILES WITH MOST LINKS")
+    lines.append("=" * 80)
+    files_by_links = sorted(
+        [(path, info['total_links']) for path, info in results['file_details'].items() if 'total_links' in info],
+        key=lambda x: x[1],
+        reverse=True
+    )
+    for path, count in files_by_links[:15]:
+        info = results['file_details'][path]
+        valid = info.get('valid_links', 0)
+        broken = info.get('broken_links', 0)
+        lines.append(f"{path}: {count} links ({valid} valid, {broken} broken)")
+
+    lines.append("\n" + "=" * 80)
+    lines.append("AUDIT COMPLETE")
+    lines.append("=" * 80)
 
-print("\n" + "=" * 80)
-print("AUDIT COMPLETE")
-print("=" * 80)
+    sys.stdout.write('\n'.join(lines) + '\n')
 
+if __name__ == '__main__':
+    main()